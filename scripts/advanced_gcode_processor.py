@@ -16,42 +16,127 @@
 import re
 import sys
 import logging
+import logging.handlers
 import os
 import argparse
+import io
 import math
+import mmap
+import shutil
+import tempfile
+from bisect import bisect_left
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice, tee, zip_longest
 
 # Get the directory where the script is located
 script_dir = os.path.dirname(os.path.abspath(__file__))
 
-# Configure logging to save in the script's directory
+# Log file in the script's directory, only written with -debug. The handler is attached
+# in the main block so that spawned workers importing this module do not truncate it;
+# forked workers inherit it and drop it in silence_worker_logging.
 log_file_path = os.path.join(script_dir, "z_shift_log.txt")
-logging.basicConfig(
-    filename=log_file_path,
-    filemode="w",
-    level=logging.INFO,
-    format="%(asctime)s - %(message)s"
-)
+LOG_BUFFER_CAPACITY = 10000  # Records buffered in memory between log file writes
+# Per-line details are logged at DEBUG and only enabled with -verbose
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+def silence_worker_logging():
+    """Pool initializer: drop the log handlers a forked worker inherits from the parent.
+
+    Otherwise each worker holds its own copy of the buffered records, writes the
+    parent's records again once its buffer fills and loses the rest on exit.
+    """
+    for handler in logger.handlers[:]:
+        logger.removeHandler(handler)
+    logger.addHandler(logging.NullHandler())
+    logger.setLevel(logging.WARNING)
 
 # Add these constants from nonPlanarInfill.py
 DEFAULT_AMPLITUDE = 0.6  # Default Z variation in mm
 DEFAULT_FREQUENCY = 1.1  # Default frequency of the sine wave
 SEGMENT_LENGTH = 1.0  # Split infill lines into segments of this length (mm)
+IO_BUFFER_SIZE = 1 << 20  # Buffer size for the streamed intermediate and output files
+PARALLEL_BATCH_SIZE = 4096  # Lines read ahead per batch when modulating infill in worker processes
+
+# Precompiled pattern for rewriting extrusion values that replace_e cannot slice out
+_E_SUB_RE = re.compile(r'E[-\d.]+')
+_LAYER_HEIGHT_RE = re.compile(rb'; layer_height = (\d*\.?\d+)', re.IGNORECASE)
+_LAYER_CHANGE_MARKER = b";AFTER_LAYER_CHANGE"
+
+# printf-style template for the segmented infill moves, formatted in one call per move
+_INFILL_MOVE_FORMAT = "G1 X%.3f Y%.3f Z%.3f E%.5f ; Correction factor: %.3f Original E: %.5f\n"
+
+# ;TYPE: comment suffixes (PrusaSlicer and OrcaSlicer names) mapped to perimeter types
+_PERIMETER_TYPES = {
+    "External perimeter": "external",
+    "Outer wall": "external",
+    "Perimeter": "internal",
+    "Inner wall": "internal",
+}
+
+def parse_g1(line):
+    """Parse the X/Y/Z/E/F words of a G-code move into a dict of floats, ignoring comments."""
+    words = {}
+    for token in line.split(';', 1)[0].split()[1:]:
+        if token[0] in 'XYZEF':
+            try:
+                words[token[0]] = float(token[1:])
+            except ValueError:
+                pass
+    return words
+
+def replace_e(line, new_e):
+    """Replace the E word of a G-code move with new_e (formatted to 5 decimals)."""
+    start = line.find(' E') + 2
+    if start > 1:
+        rest = line[start:]
+        end = start + len(rest) - len(rest.lstrip('-0123456789.'))
+        if end > start:
+            return f"{line[:start]}{new_e:.5f}{line[end:]}"
+    # Unusual layout (no space before E, or E without a value): fall back to the regex
+    return _E_SUB_RE.sub(f'E{new_e:.5f}', line)
 
 # Add these helper functions from nonPlanarInfill.py
 def segment_line(x1, y1, x2, y2, segment_length):
-    """Divide a line into smaller segments."""
-    segments = []
-    total_length = math.sqrt((x2 - x1)**2 + (y2 - y1)**2)
+    """Divide a line into smaller segments, returned as separate lists of X and Y coordinates."""
+    dx = x2 - x1
+    dy = y2 - y1
+    total_length = math.sqrt(dx**2 + dy**2)
     num_segments = max(1, int(total_length // segment_length))
-    
-    for i in range(num_segments + 1):
-        t = i / num_segments
-        x = x1 + t * (x2 - x1)
-        y = y1 + t * (y2 - y1)
-        segments.append((x, y))
-    
-    logging.debug(f"Segmented line ({x1}, {y1}) -> ({x2}, {y2}) into {len(segments)} segments.")
-    return segments
+
+    ts = [i / num_segments for i in range(num_segments + 1)]
+    xs = [x1 + t * dx for t in ts]
+    ys = [y1 + t * dy for t in ts]
+
+    logger.debug("Segmented line (%s, %s) -> (%s, %s) into %d segments.", x1, y1, x2, y2, len(xs))
+    return xs, ys
+
+def modulate_segments(xs, ys, current_z, amplitude, frequency, extrusion_per_segment):
+    """Build the Z-modulated G1 moves for one segmented infill line as a single string."""
+    # Bind the math functions and constants used per segment to locals
+    sin = math.sin
+    sqrt = math.sqrt
+    segment_2d = SEGMENT_LENGTH
+    segment_2d_sq = segment_2d * segment_2d
+    moves = []
+    append = moves.append
+    # Single pass per segment: modulate Z, derive the correction factor, format the move
+    for sx, sy in zip(xs, ys):
+        z_mod = current_z + amplitude * sin(frequency * sx)
+        # Simple correction factor based on segment height difference
+        dz = z_mod - current_z
+        correction_factor = sqrt(segment_2d_sq + dz * dz) / segment_2d
+        append(_INFILL_MOVE_FORMAT % (sx, sy, z_mod, extrusion_per_segment * correction_factor, correction_factor, extrusion_per_segment))
+    return "".join(moves)
+
+def modulate_infill_move(x1, y1, x2, y2, current_z, amplitude, frequency, e):
+    """Segment one infill move and return its Z-modulated G1 moves as a single string."""
+    xs, ys = segment_line(x1, y1, x2, y2, SEGMENT_LENGTH)
+    return modulate_segments(xs, ys, current_z, amplitude, frequency, e / len(xs))
+
+def order_walls(walls):
+    """Return buffered (is_shifted, wall) pairs as strings, non-shifted walls first."""
+    return [wall.getvalue() for _, wall in sorted(walls, key=lambda item: item[0])]
 
 def reset_modulation_state():
     """Reset parameters for Z-modulation to avoid propagating patterns."""
@@ -59,60 +144,96 @@ def reset_modulation_state():
     last_sx = 0
 
 def update_layer_bounds(current_z, solid_infill_heights):
-    """Update the bounds for non-planar processing based on current Z height."""
+    """Update the bounds for non-planar processing based on current Z height.
+
+    solid_infill_heights must be sorted in ascending order without duplicates.
+    """
     global last_bottom_layer, next_top_layer
-    lower_layers = [z for z in solid_infill_heights if z < current_z]
-    upper_layers = [z for z in solid_infill_heights if z > current_z]
-    if lower_layers:
-        last_bottom_layer = max(lower_layers)
-    if upper_layers:
-        next_top_layer = min(upper_layers)
-
-def process_nonplanar_infill(lines, current_z, amplitude, frequency, solid_infill_heights):
-    """Process only the non-planar infill modifications."""
-    modified_lines = []
+    lower_index = bisect_left(solid_infill_heights, current_z)
+    upper_index = lower_index
+    if upper_index < len(solid_infill_heights) and solid_infill_heights[upper_index] == current_z:
+        upper_index += 1
+    if lower_index > 0:
+        last_bottom_layer = solid_infill_heights[lower_index - 1]
+    if upper_index < len(solid_infill_heights):
+        next_top_layer = solid_infill_heights[upper_index]
+
+def process_nonplanar_infill(lines, current_z, amplitude, frequency, solid_infill_heights, executor=None, workers=1):
+    """Process only the non-planar infill modifications, yielding output lines.
+
+    solid_infill_heights must be sorted in ascending order without duplicates. If an executor is given,
+    the infill moves are modulated in its worker processes, batch by batch and in order; workers is the
+    pool size and sets how the moves of a batch are chunked.
+    """
+    items = _nonplanar_infill_items(lines, current_z, amplitude, frequency, solid_infill_heights)
+    while True:
+        batch = list(islice(items, PARALLEL_BATCH_SIZE))
+        if not batch:
+            break
+        moves = [item for item in batch if not isinstance(item, str)]
+        if not moves:
+            results = iter(())
+        elif executor is None:
+            results = map(modulate_infill_move, *zip(*moves))
+        else:
+            # Hand each worker a few large chunks so pickling/IPC doesn't outweigh the work
+            chunksize = max(1, len(moves) // (4 * workers))
+            results = iter(executor.map(modulate_infill_move, *zip(*moves), chunksize=chunksize))
+        for item in batch:
+            yield item if isinstance(item, str) else next(results)
+
+def _nonplanar_infill_items(lines, current_z, amplitude, frequency, solid_infill_heights):
+    """Yield passthrough lines, and argument tuples for modulate_infill_move for infill moves."""
     in_infill = False
     last_bottom_layer = 0
     next_top_layer = float('inf')
-    processed_indices = set()
+    height_count = len(solid_infill_heights)
 
     def update_layer_bounds(current_z):
         nonlocal last_bottom_layer, next_top_layer
-        lower_layers = [z for z in solid_infill_heights if z < current_z]
-        upper_layers = [z for z in solid_infill_heights if z > current_z]
-        if lower_layers:
-            last_bottom_layer = max(lower_layers)
-        if upper_layers:
-            next_top_layer = min(upper_layers)
-
-    for line_num, line in enumerate(lines):
-        if line.startswith('G1') and 'Z' in line:
-            z_match = re.search(r'Z([-+]?\d*\.?\d+)', line)
-            if z_match:
-                current_z = float(z_match.group(1))
-                update_layer_bounds(current_z)
+        # Heights are unique, so at most one of them equals current_z
+        lower_index = bisect_left(solid_infill_heights, current_z)
+        upper_index = lower_index
+        if upper_index < height_count and solid_infill_heights[upper_index] == current_z:
+            upper_index += 1
+        if lower_index > 0:
+            last_bottom_layer = solid_infill_heights[lower_index - 1]
+        if upper_index < height_count:
+            next_top_layer = solid_infill_heights[upper_index]
+
+    # Pair every line with its successor so infill moves can look one line ahead
+    current_lines, next_lines = tee(lines)
+    next(next_lines, None)
+
+    for line, next_line in zip_longest(current_lines, next_lines):
+        # Only G-code moves and comments can affect the infill state; pass everything else through
+        first = line[:1]
+        if first != 'G' and first != ';':
+            yield line
+            continue
 
-        if ';TYPE:Internal infill' in line:
+        if first == 'G':
+            if line.startswith('G1') and 'Z' in line:
+                z = parse_g1(line).get('Z')
+                if z is not None:
+                    current_z = z
+                    update_layer_bounds(current_z)
+        elif ';TYPE:Internal infill' in line:
             in_infill = True
-            modified_lines.append(line)
+            yield line
             continue
         elif line.startswith(';TYPE:'):
             in_infill = False
 
-        if in_infill and line_num not in processed_indices and line.startswith('G1') and 'E' in line:
-            processed_indices.add(line_num)
-            match = re.search(r'X([-+]?\d*\.?\d+)\s*Y([-+]?\d*\.?\d+)\s*E([-+]?\d*\.?\d+)', line)
-            if match:
-                x1, y1, e = map(float, match.groups())
-                next_line_index = line_num + 1
+        if in_infill and line.startswith('G1') and 'E' in line:
+            words = parse_g1(line)
+            if 'X' in words and 'Y' in words and 'E' in words:
+                x1, y1, e = words['X'], words['Y'], words['E']
                 
-                if next_line_index < len(lines):
-                    next_line = lines[next_line_index]
-                    next_match = re.search(r'X([-+]?\d*\.?\d+)\s*Y([-+]?\d*\.?\d+)', next_line)
-                    if next_match:
-                        x2, y2 = map(float, next_match.groups())
-                        segments = segment_line(x1, y1, x2, y2, SEGMENT_LENGTH)
-                        
+                if next_line is not None:
+                    next_words = parse_g1(next_line)
+                    if 'X' in next_words and 'Y' in next_words:
+                        x2, y2 = next_words['X'], next_words['Y']
                         distance_to_top = next_top_layer - current_z
                         distance_to_bottom = current_z - last_bottom_layer
                         total_distance = next_top_layer - last_bottom_layer
@@ -121,29 +242,13 @@ def process_nonplanar_infill(lines, current_z, amplitude, frequency, solid_infil
                         else:
                             scaling_factor = 1.0
 
-                        extrusion_per_segment = e / len(segments)
-                        
-                        for i, (sx, sy) in enumerate(segments):
-                            z_mod = current_z + amplitude * scaling_factor * math.sin(frequency * sx)
-                            
-                            # Simple correction factor based on segment height difference
-                            dz = abs(z_mod - current_z)
-                            segment_2d = SEGMENT_LENGTH
-                            segment_3d = math.sqrt(segment_2d**2 + dz**2)
-                            correction_factor = segment_3d / segment_2d
-                            
-                            modified_lines.append(
-                                f"G1 X{sx:.3f} Y{sy:.3f} Z{z_mod:.3f} "
-                                f"E{(extrusion_per_segment * correction_factor):.5f} ; Correction factor: {correction_factor:.3f} Original E: {extrusion_per_segment:.5f}\n"
-                            )
+                        yield (x1, y1, x2, y2, current_z, amplitude * scaling_factor, frequency, e)
                         continue
         
-        modified_lines.append(line)
-    
-    return modified_lines
+        yield line
 
-def process_wall_shifting(lines, layer_height, extrusion_multiplier, enable_wall_reorder=True):
-    """Process only the wall shifting modifications."""
+def process_wall_shifting(lines, layer_height, extrusion_multiplier, total_layers, enable_wall_reorder=True):
+    """Process only the wall shifting modifications, yielding output lines."""
     current_layer = 0
     current_z = 0.0
     perimeter_type = None
@@ -152,82 +257,81 @@ def process_wall_shifting(lines, layer_height, extrusion_multiplier, enable_wall
     previous_g1_movement = None
     previous_f_speed = None
     z_shift = layer_height * 0.5
+
+    # Bind the per-line helpers to locals to skip global/attribute lookups in the loop
+    parse = parse_g1
     
-    # Add buffers for shifted and non-shifted walls (only used if wall_reorder is enabled)
-    shifted_wall_buffer = []
-    nonshifted_wall_buffer = []
-    current_wall_buffer = []
+    # Completed walls waiting to be reordered (only used if wall_reorder is enabled).
+    # Each wall accumulates in its own StringIO; a shifted/non-shifted pair is emitted
+    # as soon as the next wall starts, so at most two walls are ever held.
+    pending_walls = []
+    current_wall_buffer = io.StringIO()
     
-    total_layers = sum(1 for line in lines if line.startswith(";AFTER_LAYER_CHANGE"))
-    modified_lines = []
 
     for line in lines:
+        # Lines that are neither moves nor comments only take the pass-through at the end of the loop
+        first = line[:1]
+        if first != "G" and first != ";":
+            if not inside_perimeter_block and not perimeter_type == "internal":
+                yield line
+            continue
+
         # Detect layer changes
         if line.startswith("G1 Z"):
-            z_match = re.search(r'Z([-\d.]+)', line)
-            if z_match:
-                current_z = float(z_match.group(1))
+            z = parse(line).get('Z')
+            if z is not None:
+                current_z = z
                 current_layer = int(current_z / layer_height)
                 perimeter_block_count = 0  # Reset block counter for new layer
-                logging.info(f"Layer {current_layer} detected at Z={current_z:.3f}")
-            modified_lines.append(line)
+                logger.info("Layer %d detected at Z=%.3f", current_layer, current_z)
+            yield line
             continue
 
-        # Detect perimeter types from PrusaSlicer comments
-        if ";TYPE:External perimeter" in line or ";TYPE:Outer wall" in line:
-            if enable_wall_reorder:
-                # Output any buffered walls when switching to external perimeter
-                if shifted_wall_buffer or nonshifted_wall_buffer:
-                    # Output non-shifted walls first
-                    for wall in nonshifted_wall_buffer:
-                        modified_lines.extend(wall)
-                    # Then output shifted walls
-                    for wall in shifted_wall_buffer:
-                        modified_lines.extend(wall)
-                    # Clear buffers
-                    shifted_wall_buffer = []
-                    nonshifted_wall_buffer = []
-            
-            perimeter_type = "external"
-            inside_perimeter_block = False
-            logging.info(f"External perimeter detected at layer {current_layer}")
-            modified_lines.append(line)
-        elif ";TYPE:Perimeter" in line or ";TYPE:Inner wall" in line:
-            perimeter_type = "internal"
-            inside_perimeter_block = False
-            if enable_wall_reorder:
-                current_wall_buffer = []  # Start a new wall buffer
-            logging.info(f"Internal perimeter block started at layer {current_layer}")
-            modified_lines.append(line)
-        elif ";TYPE:" in line:  # Reset for other types
-            if enable_wall_reorder:
-                # Output any remaining buffered walls
-                if shifted_wall_buffer or nonshifted_wall_buffer:
-                    for wall in nonshifted_wall_buffer:
-                        modified_lines.extend(wall)
-                    for wall in shifted_wall_buffer:
-                        modified_lines.extend(wall)
-                    shifted_wall_buffer = []
-                    nonshifted_wall_buffer = []
-            
-            perimeter_type = None
+        # Classify the line once; the X/Y/E/F checks only matter for G1 moves
+        is_g1 = line.startswith("G1")
+        has_x = is_g1 and "X" in line
+        has_y = is_g1 and "Y" in line
+        has_e = is_g1 and "E" in line
+        has_f = is_g1 and "F" in line
+
+        # Detect perimeter types from PrusaSlicer/OrcaSlicer comments
+        if line.startswith(";TYPE:"):
+            new_perimeter_type = _PERIMETER_TYPES.get(line[6:].strip())
+            if enable_wall_reorder and new_perimeter_type != "internal":
+                # Output any buffered walls when leaving internal perimeters
+                if pending_walls:
+                    yield from order_walls(pending_walls)
+                    pending_walls = []
+
+            if new_perimeter_type == "external":
+                logger.info("External perimeter detected at layer %d", current_layer)
+            elif new_perimeter_type == "internal":
+                if enable_wall_reorder:
+                    current_wall_buffer = io.StringIO()  # Start a new wall buffer
+                logger.info("Internal perimeter block started at layer %d", current_layer)
+
+            perimeter_type = new_perimeter_type
             inside_perimeter_block = False
-            modified_lines.append(line)
+            yield line
 
         # Group lines into perimeter blocks
-        elif perimeter_type == "internal" and line.startswith("G1") and "X" in line and "Y" in line and "E" in line:
+        elif perimeter_type == "internal" and has_x and has_y and has_e:
             # Start a new perimeter block if not already inside one
             if not inside_perimeter_block:
                 perimeter_block_count += 1
                 inside_perimeter_block = True
                 if enable_wall_reorder:
-                    current_wall_buffer = []  # Start a new wall buffer
+                    # Output the previous pair, non-shifted wall first
+                    if len(pending_walls) == 2:
+                        yield from order_walls(pending_walls)
+                        pending_walls = []
+                    current_wall_buffer = io.StringIO()  # Start a new wall buffer
                 
                 # Add the cached movement command first
                 if previous_g1_movement:
                     if enable_wall_reorder:
-                        current_wall_buffer.append(f"{previous_g1_movement};Previous position\n")
-                        current_wall_buffer.append(f"G1 F{previous_f_speed:.3f} ; F speed from previous G1 movement\n")
+                        current_wall_buffer.write(f"{previous_g1_movement};Previous position\n")
+                        current_wall_buffer.write(f"G1 F{previous_f_speed:.3f} ; F speed from previous G1 movement\n")
                     
                 
                 # Set Z height and determine if wall is shifted
@@ -239,135 +343,170 @@ def process_wall_shifting(lines, layer_height, extrusion_multiplier, enable_wall
                     z_command = f"G1 Z{current_z:.3f} ; Reset Z for block #{perimeter_block_count}\n"
 
                 if enable_wall_reorder:
-                    current_wall_buffer.append(z_command)
+                    current_wall_buffer.write(z_command)
                 else:
-                    modified_lines.append(z_command)
+                    yield z_command
 
             # Process the current line (including extrusion adjustments)
             if is_shifted:
-                e_match = re.search(r'E([-\d.]+)', line)
-                if e_match:
-                    e_value = float(e_match.group(1))
+                e_value = parse(line).get('E')
+                if e_value is not None:
                     original_line = line
                     if current_layer == 1:  # First layer
                         new_e_value = e_value * 1.5  # 50% more extrusion
-                        line = re.sub(r'E[-\d.]+', f'E{new_e_value:.5f}', line).strip()
+                        line = replace_e(line, new_e_value).strip()
                         line += f" ; Adjusted E for first layer (1.5x), block #{perimeter_block_count}\n"
                     elif current_layer == total_layers - 1:  # Last layer
                         new_e_value = e_value * 0.5  # 50% less extrusion
-                        line = re.sub(r'E[-\d.]+', f'E{new_e_value:.5f}', line).strip()
+                        line = replace_e(line, new_e_value).strip()
                         line += f" ; Adjusted E for last layer (0.5x), block #{perimeter_block_count}\n"
                     else:  # Regular layers
                         line += f" ; current layer: {current_layer} total layers: {total_layers} \n"
                         new_e_value = e_value * extrusion_multiplier
-                        line = re.sub(r'E[-\d.]+', f'E{new_e_value:.5f}', line).strip()
+                        line = replace_e(line, new_e_value).strip()
                         line += f" ; Adjusted E for regular layer ({extrusion_multiplier}x), block #{perimeter_block_count}\n"
               
 
             if enable_wall_reorder:
-                current_wall_buffer.append(line)
+                current_wall_buffer.write(line)
             else:
-                modified_lines.append(line)
+                yield line
 
 
 
-        elif perimeter_type == "internal" and line.startswith("G1") and "X" in line and "Y" in line and "F" in line:
+        elif perimeter_type == "internal" and has_x and has_y and has_f:
             # End of perimeter block
             if inside_perimeter_block:
                 if enable_wall_reorder:
-                    current_wall_buffer.append(line)
+                    current_wall_buffer.write(line)
                     # Add Z reset for shifted blocks
                     if is_shifted:
-                        current_wall_buffer.append(f"G1 Z{current_z:.3f} ; Reset Z after shifted block #{perimeter_block_count}\n")
-                    # Add completed wall to appropriate buffer
-                    if is_shifted:
-                        shifted_wall_buffer.append(current_wall_buffer)
-                    else:
-                        nonshifted_wall_buffer.append(current_wall_buffer)
+                        current_wall_buffer.write(f"G1 Z{current_z:.3f} ; Reset Z after shifted block #{perimeter_block_count}\n")
+                    # Queue the completed wall until its complement is done
+                    pending_walls.append((is_shifted, current_wall_buffer))
                 else:
-                    modified_lines.append(line)
+                    yield line
                     if is_shifted:
-                        modified_lines.append(f"G1 Z{current_z:.3f} ; Reset Z after shifted block #{perimeter_block_count}\n")
+                        yield f"G1 Z{current_z:.3f} ; Reset Z after shifted block #{perimeter_block_count}\n"
                 inside_perimeter_block = False
                 
-        elif perimeter_type == "internal" and line.startswith("G1") and "F" in line:  #fix for Fspeed movements inside perimeter blocks
+        elif perimeter_type == "internal" and has_f:  #fix for Fspeed movements inside perimeter blocks
             if enable_wall_reorder:
-                current_wall_buffer.append(line)
+                current_wall_buffer.write(line)
             else:
-                modified_lines.append(line)
+                yield line
         # Cache G1 movements with X and Y coordinates and F speeds
-        if line.startswith("G1"):
-            if "X" in line and "Y" in line:
+        if is_g1:
+            if has_x and has_y:
                 previous_g1_movement = line.strip()
-                logging.info(f"Cached G1 movement: {previous_g1_movement}")
-            if "F" in line:
-                f_match = re.search(r'F([\d.]+)', line)
-                if f_match:
-                    previous_f_speed = float(f_match.group(1))
-                    logging.info(f"Cached F speed: {previous_f_speed}")
+                logger.debug("Cached G1 movement: %s", previous_g1_movement)
+            if has_f:
+                f_speed = parse(line).get('F')
+                if f_speed is not None:
+                    previous_f_speed = f_speed
+                    logger.debug("Cached F speed: %s", previous_f_speed)
 
         # Add non-wall lines directly to output
         if not inside_perimeter_block and not perimeter_type == "internal":
-            modified_lines.append(line)
-
-    return modified_lines
-
-def get_layer_height(gcode_lines):
-    """Extract layer height from G-code header comments"""
+            yield line
+
+def count_line_prefix(data, prefix):
+    """Count the lines of a bytes-like buffer that start with prefix."""
+    count = 1 if data[:len(prefix)] == prefix else 0
+    needle = b"\n" + prefix
+    find = data.find
+    pos = find(needle)
+    while pos != -1:
+        count += 1
+        pos = find(needle, pos + len(needle))
+    return count
+
+def scan_gcode(input_file):
+    """Extract the layer height and layer count by searching the raw file bytes.
+
+    Returns (layer_height, total_layers); layer_height is None if it is not in the file.
+    """
+    with open(input_file, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return None, 0
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            total_layers = count_line_prefix(mm, _LAYER_CHANGE_MARKER)
+            match = _LAYER_HEIGHT_RE.search(mm)
+            layer_height = float(match.group(1)) if match else None
+    return layer_height, total_layers
+
+def scan_solid_infill(gcode_lines):
+    """Collect the Z heights of solid infill sections.
+
+    Returns (solid_infill_heights, last_z).
+    """
+    solid_infill_heights = []
+    current_z = 0.0
     for line in gcode_lines:
-        if "; layer_height =" in line.lower():
-            match = re.search(r'layer_height = (\d*\.?\d+)', line, re.IGNORECASE)
-            if match:
-                return float(match.group(1))
-    return None
-
-def process_gcode(input_file, extrusion_multiplier, enable_nonplanar=False, enable_wall_reorder=True, amplitude=DEFAULT_AMPLITUDE, frequency=DEFAULT_FREQUENCY):
-    logging.info("Starting G-code processing")
-    logging.info(f"Input file: {input_file}")
-
-    # Read the input G-code
-    with open(input_file, 'r') as infile:
-        lines = infile.readlines()
-
-    # Get layer height from G-code
-    layer_height = get_layer_height(lines)
-    if layer_height is None:
-        layer_height = 0.2  # Default fallback value
-        logging.warning(f"Could not detect layer height from G-code, using default value: {layer_height}mm")
-    else:
-        logging.info(f"Detected layer height from G-code: {layer_height}mm")
-
-    # First pass: Process non-planar infill if enabled
-    if enable_nonplanar:
-        logging.info("Processing non-planar infill modifications...")
-        solid_infill_heights = []
-        current_z = 0.0
-        
-        # Collect solid infill heights
-        for line in lines:
-            if line.startswith('G1') and 'Z' in line:
-                z_match = re.search(r'Z([-+]?\d*\.?\d+)', line)
-                if z_match:
-                    current_z = float(z_match.group(1))
-            if ';TYPE:Solid infill' in line:
-                solid_infill_heights.append(current_z)
-                logging.info(f"Found solid infill at Z={current_z}")
-
-        # Process non-planar infill
-        lines = process_nonplanar_infill(lines, current_z, amplitude, frequency, solid_infill_heights)
-        logging.info("Non-planar infill processing completed")
-
-    # Second pass: Process wall shifting
-    logging.info("Processing wall shifting modifications...")
-    modified_lines = process_wall_shifting(lines, layer_height, extrusion_multiplier, enable_wall_reorder)
-    logging.info("Wall shifting processing completed")
-
-    # Write the final modified G-code
-    with open(input_file, 'w') as outfile:
-        outfile.writelines(modified_lines)
-
-    logging.info("G-code processing completed")
-    logging.info(f"Log file saved at {log_file_path}")
+        if line.startswith('G1') and 'Z' in line:
+            z = parse_g1(line).get('Z')
+            if z is not None:
+                current_z = z
+        if ';TYPE:Solid infill' in line:
+            solid_infill_heights.append(current_z)
+            logger.info("Found solid infill at Z=%s", current_z)
+    return solid_infill_heights, current_z
+
+def process_gcode(input_file, extrusion_multiplier, enable_nonplanar=False, enable_wall_reorder=True, amplitude=DEFAULT_AMPLITUDE, frequency=DEFAULT_FREQUENCY, jobs=1):
+    logger.info("Starting G-code processing")
+    logger.info("Input file: %s", input_file)
+
+    # Stream into a temporary file next to the input, then swap it into place
+    output_dir = os.path.dirname(os.path.abspath(input_file))
+    with tempfile.NamedTemporaryFile(mode='w', buffering=IO_BUFFER_SIZE, dir=output_dir, suffix='.tmp', delete=False) as outfile:
+        try:
+            with open(input_file, 'r', buffering=IO_BUFFER_SIZE) as infile, \
+                    tempfile.TemporaryFile(mode='w+', buffering=IO_BUFFER_SIZE) as infill_file:
+                # Get layer height and layer count without decoding the file line by line
+                layer_height, total_layers = scan_gcode(input_file)
+                if layer_height is None:
+                    layer_height = 0.2  # Default fallback value
+                    logger.warning("Could not detect layer height from G-code, using default value: %smm", layer_height)
+                else:
+                    logger.info("Detected layer height from G-code: %smm", layer_height)
+                lines = infile
+
+                # First pass: Process non-planar infill if enabled
+                if enable_nonplanar:
+                    logger.info("Processing non-planar infill modifications...")
+                    solid_infill_heights, current_z = scan_solid_infill(infile)
+                    infile.seek(0)
+                    # Every solid infill section adds a height; keep each one once, sorted for bisect
+                    solid_infill_heights = tuple(sorted(set(solid_infill_heights)))
+
+                    # Process non-planar infill into the intermediate file; a single worker runs in-process
+                    workers = jobs or os.cpu_count() or 1
+                    if workers == 1:
+                        infill_file.writelines(process_nonplanar_infill(infile, current_z, amplitude, frequency, solid_infill_heights))
+                    else:
+                        # Write out the buffered records so no forked worker starts with a copy of them
+                        for handler in logger.handlers:
+                            handler.flush()
+                        with ProcessPoolExecutor(max_workers=workers, initializer=silence_worker_logging) as executor:
+                            infill_file.writelines(process_nonplanar_infill(infile, current_z, amplitude, frequency, solid_infill_heights, executor, workers))
+                    infill_file.seek(0)
+                    lines = infill_file
+                    logger.info("Non-planar infill processing completed")
+
+                # Second pass: Process wall shifting and write the final modified G-code
+                logger.info("Processing wall shifting modifications...")
+                outfile.writelines(process_wall_shifting(lines, layer_height, extrusion_multiplier, total_layers, enable_wall_reorder))
+                logger.info("Wall shifting processing completed")
+        except BaseException:
+            outfile.close()
+            os.unlink(outfile.name)
+            raise
+
+    shutil.copymode(input_file, outfile.name)
+    os.replace(outfile.name, input_file)
+
+    logger.info("G-code processing completed")
+    logger.info("Log file saved at %s", log_file_path)
 
 # Main execution
 if __name__ == "__main__":
@@ -378,7 +517,20 @@ if __name__ == "__main__":
     parser.add_argument("-wallReorder", type=int, choices=[0, 1], default=1, help="Enable wall reordering (0=off, 1=on)")
     parser.add_argument("-amplitude", type=float, default=DEFAULT_AMPLITUDE, help=f"Amplitude of the Z modulation (default: {DEFAULT_AMPLITUDE})")
     parser.add_argument("-frequency", type=float, default=DEFAULT_FREQUENCY, help=f"Frequency of the Z modulation (default: {DEFAULT_FREQUENCY})")
+    parser.add_argument("-jobs", type=int, default=1, help="Worker processes for non-planar infill (default: 1, 0 = one per CPU)")
+    parser.add_argument("-debug", action="store_true", help=f"Write a processing log to {os.path.basename(log_file_path)}")
+    parser.add_argument("-verbose", action="store_true", help="Also log per-line processing details (implies -debug, slow on large files; infill segmentation is not logged when -jobs uses worker processes)")
     args = parser.parse_args()
+    if args.jobs < 0:
+        parser.error("argument -jobs: must be 0 or a positive number")
+
+    if args.debug or args.verbose:
+        file_handler = logging.FileHandler(log_file_path, mode="w")
+        file_handler.setFormatter(logging.Formatter("%(asctime)s - %(message)s"))
+        logger.addHandler(logging.handlers.MemoryHandler(LOG_BUFFER_CAPACITY, target=file_handler))
+        logger.setLevel(logging.DEBUG if args.verbose else logging.INFO)
+    else:
+        logger.setLevel(logging.WARNING)
 
     process_gcode(
         input_file=args.input_file,
@@ -387,4 +539,5 @@ if __name__ == "__main__":
         enable_wall_reorder=bool(args.wallReorder),
         amplitude=args.amplitude,
         frequency=args.frequency,
+        jobs=args.jobs,
     )
\ No newline at end of file
@@ -19,15 +19,26 @@ import math
 import sys
 import logging
 import argparse
+import os
+import shutil
+import tempfile
+from bisect import bisect_left
 from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain, islice
 
-def sine_wave(x):
-    return math.sin(x)
+TWO_PI = 2 * math.pi  # Period of the wave functions
+HALF_PI = math.pi / 2  # Phase shift between alternating wall loops
+# Periods are reduced with float %: it is a single opcode, while math.fmod plus the
+# sign fix-up for negative angles measured about twice as slow with identical results.
+
+# The libm sine is used as-is: a Python wrapper or lookup table costs more per sample than math.sin itself
+sine_wave = math.sin
 
 def triangle_wave(x):
     # Create a sharp triangle wave
      # Normalized position t in [0,1) inside each 2π period:
-    t = (x / (2 * math.pi)) % 1.0
+    t = (x / TWO_PI) % 1.0
 
     if t < 0.5:
         # first half of the 2π: ramp from −1 to +1
@@ -43,7 +54,7 @@ def triangle_wave(x):
 def trapezoidal_wave(x):
  
     # t in [0,1) is the fractional position within each 2π:
-    t = (x / (2 * math.pi)) % 1.0
+    t = (x / TWO_PI) % 1.0
 
     if t < 0.25:
         # Ramp from −1 up to +1 over the first quarter‐period
@@ -67,7 +78,7 @@ def trapezoidal_wave(x):
 
 def sawtooth_wave(x):
    
-    return 1.0 - ( (x % (2 * math.pi)) / math.pi )
+    return 1.0 - ( (x % TWO_PI) / math.pi )
 
 # Dictionary mapping function names to their implementations
 PERIODIC_FUNCTIONS = {
@@ -77,19 +88,73 @@ PERIODIC_FUNCTIONS = {
     "sawtooth": sawtooth_wave
 }
 
-logging.basicConfig(
-    level=logging.DEBUG,
-    format="%(asctime)s - %(levelname)s - %(message)s",
-    handlers=[
-        logging.FileHandler("gcode_debug.log"),
-        logging.StreamHandler(sys.stdout)
+# Batch versions of the wave functions: same formulas, evaluated over a whole
+# list of angles in one comprehension instead of one Python call per sample
+def sine_waves(angles):
+    return list(map(math.sin, angles))
+
+def triangle_waves(angles):
+    ts = [(x / TWO_PI) % 1.0 for x in angles]
+    return [-1.0 + (4.0 * t) if t < 0.5 else 3.0 - (4.0 * t) for t in ts]
+
+def trapezoidal_waves(angles):
+    ts = [(x / TWO_PI) % 1.0 for x in angles]
+    return [
+        -1.0 + (t / 0.25) * 2.0 if t < 0.25
+        else +1.0 if t < 0.50
+        else +1.0 - ((t - 0.50) / 0.25) * 2.0 if t < 0.75
+        else -1.0
+        for t in ts
     ]
-)
+
+def sawtooth_waves(angles):
+    pi = math.pi
+    return [1.0 - ( (x % TWO_PI) / pi ) for x in angles]
+
+PERIODIC_BATCH_FUNCTIONS = {
+    "sine": sine_waves,
+    "triangle": triangle_waves,
+    "trapezoidal": trapezoidal_waves,
+    "sawtooth": sawtooth_waves
+}
+
+# Wave input for each modulation direction, per point and over whole coordinate lists;
+# unknown directions fall back to "x"
+DIRECTION_FUNCTIONS = {
+    "x": lambda x, y: x,
+    "y": lambda x, y: y,
+    "xy": lambda x, y: x + y,
+    "negx": lambda x, y: -x,
+    "negy": lambda x, y: -y,
+    "negxy": lambda x, y: -(x + y)
+}
+
+DIRECTION_BATCH_FUNCTIONS = {
+    "x": lambda xs, ys: xs,
+    "y": lambda xs, ys: ys,
+    "xy": lambda xs, ys: [x + y for x, y in zip(xs, ys)],
+    "negx": lambda xs, ys: [-x for x in xs],
+    "negy": lambda xs, ys: [-y for y in ys],
+    "negxy": lambda xs, ys: [-(x + y) for x, y in zip(xs, ys)]
+}
 
 DEFAULT_AMPLITUDE = 0.3
 DEFAULT_FREQUENCY = 1.1
 DEFAULT_MAX_STEP = 0.1  # Default 10% step size per layer
 DEFAULT_RESOLUTION = 0.2  # Default segment length in mm
+IO_BUFFER_SIZE = 1 << 20  # Buffer size for the streamed output file
+PARALLEL_BATCH_SIZE = 4096  # Input lines read ahead per batch when modulating in worker processes
+
+# Precompiled patterns for the per-line parsing in process_gcode
+_RE_Z = re.compile(r'Z([-+]?[\d]*\.?[\d]+)')
+_RE_XY = re.compile(r'X([-+]?[\d]*\.?[\d]+).*?Y([-+]?[\d]*\.?[\d]+)')
+_RE_XYE = re.compile(r'X([-+]?[\d]*\.?[\d]+)\s*Y([-+]?[\d]*\.?[\d]+)\s*E([-+]?[\d]*\.?[\d]+)')
+
+# Output templates for the modulated moves (%-formatting is cheaper than f-strings here)
+_SEGMENT_MOVE_FORMAT = "G1 X%.3f Y%.3f Z%.3f E%.5f\n"
+_SEGMENT_MOVE_VERBOSE_FORMAT = "G1 X%.3f Y%.3f Z%.3f E%.5f ;seg %d/%d from (%.3f,%.3f)->(%.3f,%.3f)\n"
+_BRIDGE_MOVE_FORMAT = "G1 X%.3f Y%.3f Z%.3f E%.5f ;Bridge\n"
+_BRIDGE_FIRST_MOVE_FORMAT = "G1 X%.3f Y%.3f Z%.3f E%.5f ;Bridge no previous point\n"
 
 # Lookup tables for different slicers
 SLICER_TYPES = {
@@ -117,16 +182,57 @@ SLICER_TYPES = {
 }
 
 
-def segment_line(x1, y1, x2, y2, segment_length):
-    segments = []
-    total_length = math.sqrt((x2 - x1)**2 + (y2 - y1)**2)
-    num_segments = max(1, int(total_length // segment_length))
-    for i in range(num_segments + 1):
-        t = i / num_segments
-        x = x1 + t * (x2 - x1)
-        y = y1 + t * (y2 - y1)
-        segments.append((x, y))
-    return segments
+def segment_line(x1, y1, x2, y2, segment_length, include_start=True):
+    # Returns the segment points as separate lists of X and Y coordinates;
+    # without include_start the start point (x1, y1) is left out
+    dx = x2 - x1
+    dy = y2 - y1
+    num_segments = max(1, int(math.hypot(dx, dy) // segment_length))
+    ts = [i / num_segments for i in range(0 if include_start else 1, num_segments + 1)]
+    return [x1 + t * dx for t in ts], [y1 + t * dy for t in ts]
+
+
+def modulate_points(xs, ys, current_z, amplitude, frequency, direction, function,
+                    phase_offset, scaling_factor, resolution, extrusion_per_segment):
+    # Modulated Z and adjusted E for the points of one segmented move, Z being seeded
+    # from current_z before the first point. Pure numeric code that touches no G-code
+    # state, so it can be compiled or run in a worker on its own.
+    sine_inputs = DIRECTION_BATCH_FUNCTIONS.get(direction, DIRECTION_BATCH_FUNCTIONS["x"])(xs, ys)
+    if phase_offset:
+        angles = [frequency * sine_input + phase_offset for sine_input in sine_inputs]
+    else:
+        angles = [frequency * sine_input for sine_input in sine_inputs]
+
+    amp_scaled = amplitude * scaling_factor
+    z_mods = [current_z + amp_scaled * wave for wave in PERIODIC_BATCH_FUNCTIONS[function](angles)]
+    hypot = math.hypot
+    # Pair each Z with the one before it without building a shifted copy
+    e_adjs = [
+        extrusion_per_segment * (hypot(resolution, z_mod - prev_z) / resolution)
+        for z_mod, prev_z in zip(z_mods, chain((current_z,), z_mods))
+    ]
+    return z_mods, e_adjs
+
+
+def modulate_move(x1, y1, x2, y2, current_z, amplitude, frequency, direction, function,
+                  phase_offset, scaling_factor, resolution, e_total, verbose):
+    # Segment one extrusion move and return its modulated G1 moves as a single string
+    # the start point only seeds Z, so it is not generated
+    xs, ys = segment_line(x1, y1, x2, y2, resolution, include_start=False)
+    num_segments = len(xs)
+
+    z_mods, e_adjs = modulate_points(
+        xs, ys, current_z, amplitude, frequency, direction, function,
+        phase_offset, scaling_factor, resolution, e_total / num_segments
+    )
+
+    # annotate the slices with their source move when verbose so you can verify
+    if verbose:
+        return "".join([
+            _SEGMENT_MOVE_VERBOSE_FORMAT % (sx, sy, z_mod, e_adj, i, num_segments, x1, y1, x2, y2)
+            for i, sx, sy, z_mod, e_adj in zip(range(1, num_segments + 1), xs, ys, z_mods, e_adjs)
+        ])
+    return "".join([_SEGMENT_MOVE_FORMAT % move for move in zip(xs, ys, z_mods, e_adjs)])
 
 
 def reset_modulation_state():
@@ -134,22 +240,30 @@ def reset_modulation_state():
     last_sx = 0
 
 
-def detect_slicer(gcode_lines):
+def detect_header(gcode_lines):
+    # Returns (slicer, gcode_flavor). The slicer is named in the first lines. Slicers
+    # write their settings, including the flavor, as a comment block at the start or
+    # the end of the file, so only the leading and trailing comment blocks are scanned
+    # for it rather than every line of G-code in between.
+    slicer = None
     for line in gcode_lines[:10]:
         if 'PrusaSlicer' in line:
-            return 'prusaslicer'
+            slicer = 'prusaslicer'
+            break
         elif 'OrcaSlicer' in line:
-            return 'orcaslicer'
+            slicer = 'orcaslicer'
+            break
         elif 'BambuStudio' in line:
-            return 'bambustudio'
-    return None
+            slicer = 'bambustudio'
+            break
 
-
-def detect_gcode_flavor(gcode_lines):
-    for line in gcode_lines:
-        if line.startswith('; gcode_flavor ='):
-            return line.split('=')[-1].strip()
-    return None
+    for block in (gcode_lines, reversed(gcode_lines)):
+        for line in block:
+            if line.startswith('; gcode_flavor ='):
+                return slicer, line.split('=')[-1].strip()
+            if not line.startswith(';') and line.strip():
+                break
+    return slicer, None
 
 
 def process_gcode(
@@ -159,14 +273,52 @@ def process_gcode(
     include_infill, include_perimeters, include_external_perimeters,
     max_step_size, alternate_loops,
     infill_function="sine", perimeter_function="sine",
-    resolution=DEFAULT_RESOLUTION
+    resolution=DEFAULT_RESOLUTION, verbose=False, executor=None, workers=1
 ):
-    modified_lines = []
+    # Yields the output G-code. Extrusion moves are modulated in the executor's
+    # worker processes if one is given, batch by batch and in input order;
+    # workers is the pool size and sets how the moves of a batch are chunked.
+    items = _modulation_items(
+        input_file,
+        wall_amplitude, wall_frequency, wall_direction,
+        infill_amplitude, infill_frequency, infill_direction,
+        include_infill, include_perimeters, include_external_perimeters,
+        max_step_size, alternate_loops,
+        infill_function, perimeter_function,
+        resolution, verbose
+    )
+    while True:
+        batch = list(islice(items, PARALLEL_BATCH_SIZE))
+        if not batch:
+            break
+        moves = [item for item in batch if not isinstance(item, str)]
+        if not moves:
+            results = iter(())
+        elif executor is None:
+            results = map(modulate_move, *zip(*moves))
+        else:
+            # Hand each worker a few large chunks so pickling/IPC doesn't outweigh the work
+            chunksize = max(1, len(moves) // (4 * workers))
+            results = iter(executor.map(modulate_move, *zip(*moves), chunksize=chunksize))
+        for item in batch:
+            yield item if isinstance(item, str) else next(results)
+
+
+def _modulation_items(
+    input_file,
+    wall_amplitude, wall_frequency, wall_direction,
+    infill_amplitude, infill_frequency, infill_direction,
+    include_infill, include_perimeters, include_external_perimeters,
+    max_step_size, alternate_loops,
+    infill_function, perimeter_function,
+    resolution, verbose
+):
+    # The G-code state machine: yields passthrough and bridge lines as strings,
+    # and the arguments of modulate_move for each modulated extrusion move.
     current_z = 0
     current_region = None
     last_bottom_layer = 0
     next_top_layer = float('inf')
-    processed_indices = set()
 
     # Variables for tracking nozzle state and detecting wall-loop starts.
     last_nozzle_position = None
@@ -174,12 +326,12 @@ def process_gcode(
     loop_count   = 0
     phase_offset = 0.0
 
+    # Read the whole file in one call and split it in one pass.
     with open(input_file, 'r') as file:
-        lines = file.readlines()
+        lines = file.read().splitlines(keepends=True)
 
     # Detect slicer type and G-code flavor.
-    slicer = detect_slicer(lines)
-    gcode_flavor = detect_gcode_flavor(lines)
+    slicer, gcode_flavor = detect_header(lines)
     if slicer and slicer.lower() in SLICER_TYPES:
         lookup = SLICER_TYPES[slicer.lower()]
         if slicer == 'orcaslicer' and gcode_flavor == 'marlin':
@@ -196,39 +348,53 @@ def process_gcode(
     EXTERNAL_PERIMETER_MARKERS = lookup["external_perimeter"]
     TYPE_PREFIX = lookup["type_prefix"]
 
-    # Gather Z values for solid infill.
+    # Map each marker line of an enabled region to that region; the first group listed wins.
+    MARKER_REGION = {}
+    for markers, region, enabled in (
+        (INFILL_MARKERS, 'infill', include_infill),
+        (PERIMETER_MARKERS, 'internal_wall', include_perimeters),
+        (EXTERNAL_PERIMETER_MARKERS, 'external_wall', include_external_perimeters),
+    ):
+        if enabled:
+            for marker in markers:
+                MARKER_REGION.setdefault(marker, region)
+
+    # Gather Z values for solid infill and the Z steps for the layer height in one pass.
     solid_infill_heights = []
+    layer_heights = []
+    last_z = None
     for line in lines:
         if line.startswith('G1') and 'Z' in line:
-            z_match = re.search(r'Z([-+]?[\d]*\.?[\d]+)', line)
+            z_match = _RE_Z.search(line)
             if z_match:
                 current_z = float(z_match.group(1))
+                if last_z is not None:
+                    layer_heights.append(current_z - last_z)
+                last_z = current_z
         if any(marker in line for marker in SOLID_INFILL_MARKERS):
             solid_infill_heights.append(current_z)
+    # Keep each height once, sorted, so the layer bounds can be found by bisection.
+    solid_infill_heights = sorted(set(solid_infill_heights))
+    height_count = len(solid_infill_heights)
+    # Constant-time membership for the same heights
+    solid_infill_set = frozenset(solid_infill_heights)
 
     def is_current_layer_solid_infill(z):
-        return z in solid_infill_heights
+        return z in solid_infill_set
 
     def update_layer_bounds(current_z):
         nonlocal last_bottom_layer, next_top_layer
-        lower_layers = [z for z in solid_infill_heights if z < current_z]
-        upper_layers = [z for z in solid_infill_heights if z > current_z]
-        if lower_layers:
-            last_bottom_layer = max(lower_layers)
-        if upper_layers:
-            next_top_layer = min(upper_layers)
+        # Nearest solid infill heights strictly below and strictly above current_z
+        lower_index = bisect_left(solid_infill_heights, current_z)
+        upper_index = lower_index
+        if upper_index < height_count and solid_infill_heights[upper_index] == current_z:
+            upper_index += 1
+        if lower_index > 0:
+            last_bottom_layer = solid_infill_heights[lower_index - 1]
+        if upper_index < height_count:
+            next_top_layer = solid_infill_heights[upper_index]
 
     # Determine layer height.
-    layer_heights = []
-    last_z = None
-    for line in lines:
-        if line.startswith('G1') and 'Z' in line:
-            z_match = re.search(r'Z([-+]?[\d]*\.?[\d]+)', line)
-            if z_match:
-                z = float(z_match.group(1))
-                if last_z is not None:
-                    layer_heights.append(z - last_z)
-                last_z = z
     layer_height = 0.2
     if layer_heights:
         height_counter = Counter(round(h, 3) for h in layer_heights if h > 0.01)
@@ -244,17 +410,37 @@ def process_gcode(
         limited_scaling_factor = min(raw_scaling_factor, max_possible_scale)
         return limited_scaling_factor
 
+    # Debug annotations on the emitted moves are only written when verbose.
+    if verbose:
+        bridge_format, bridge_first_format = _BRIDGE_MOVE_FORMAT, _BRIDGE_FIRST_MOVE_FORMAT
+    else:
+        bridge_format = bridge_first_format = _SEGMENT_MOVE_FORMAT
+
     # Main processing loop.
-    for line_num, line in enumerate(lines):
-        if line_num in processed_indices:
+    for line in lines:
+        # Only G1 moves and type markers change any state; every other line
+        # (comments, M73 and other M-codes, G0, G92, ...) passes straight through.
+        if not line.startswith('G1'):
+            # Set region based on markers. Every marker contains the type prefix,
+            # so the other lines skip the lookup.
+            if TYPE_PREFIX in line:
+                current_region = MARKER_REGION.get(line.rstrip())
+                if current_region == 'internal_wall':
+                    in_new_wall_region = True
+                    if alternate_loops:
+                        loop_count = 0
+                        phase_offset = 0.0
+                elif current_region == 'external_wall':
+                    in_new_wall_region = True
+            yield line
             continue
 
         # --- New Travel Move Handling ---
         # If a G1 line contains X/Y but no E, we assume it is a travel move
         # (for example, a move to the start of a new wall loop). In that case, we simply update
         # the stored nozzle position and clear the "new wall" flag, outputting the line as-is.
-        if line.startswith("G1") and ("X" in line or "Y" in line) and "E" not in line:
-            pos_match = re.search(r'X([-+]?[\d]*\.?[\d]+).*?Y([-+]?[\d]*\.?[\d]+)', line)
+        if ("X" in line or "Y" in line) and "E" not in line:
+            pos_match = _RE_XY.search(line)
             if pos_match:
                 last_nozzle_position = (float(pos_match.group(1)), float(pos_match.group(2)))
             #in_new_wall_region = False  # Clear the flag: we've started a new loop.
@@ -262,47 +448,25 @@ def process_gcode(
                 in_new_wall_region = True
                 if alternate_loops:
                     loop_count += 1
-                    phase_offset = (loop_count % 2) * (math.pi / 2)
-            modified_lines.append(line)
-            processed_indices.add(line_num)
-            
-            continue
-
-        if line.startswith('M73'):
-            modified_lines.append(line)
+                    phase_offset = (loop_count & 1) * HALF_PI
+            yield line
             continue
 
         # Update Z and layer bounds on Z moves.
-        if line.startswith('G1') and 'Z' in line:
-            z_match = re.search(r'Z([-+]?[\d]*\.?[\d]+)', line)
+        if 'Z' in line:
+            z_match = _RE_Z.search(line)
             if z_match:
                 current_z = float(z_match.group(1))
                 reset_modulation_state()
                 update_layer_bounds(current_z)
 
-        # Set region based on markers.
-        if any(marker in line for marker in INFILL_MARKERS) and include_infill:
-            current_region = 'infill'
-        elif any(marker in line for marker in PERIMETER_MARKERS) and include_perimeters:
-            current_region = 'internal_wall'
-            in_new_wall_region = True
-            if alternate_loops:
-                loop_count = 0
-                phase_offset = 0.0 
-        elif any(marker in line for marker in EXTERNAL_PERIMETER_MARKERS) and include_external_perimeters:
-            current_region = 'external_wall'
-            in_new_wall_region = True
-            
-        elif TYPE_PREFIX in line:
-            current_region = None
-
         # Process modulated moves that have an extrusion value.
-        if current_region in ['infill', 'internal_wall', 'external_wall'] and line.startswith('G1') and 'E' in line:
+        if current_region in ['infill', 'internal_wall', 'external_wall'] and 'E' in line:
             # For walls, if we're at the very start of a new wall region,
             # check if bridging is needed.
             if current_region in ['internal_wall', 'external_wall'] and in_new_wall_region:
                 in_new_wall_region = False
-                match = re.search(r'X([-+]?[\d]*\.?[\d]+)\s*Y([-+]?[\d]*\.?[\d]+)\s*E([-+]?[\d]*\.?[\d]+)', line)
+                match = _RE_XYE.search(line)
                 if match:
                     wall_x = float(match.group(1))
                     wall_y = float(match.group(2))
@@ -311,35 +475,24 @@ def process_gcode(
                     if last_nozzle_position is not None and (last_nozzle_position != (wall_x, wall_y)):
                         x1, y1 = last_nozzle_position
                         x2, y2 = wall_x, wall_y
-                        segments = segment_line(x1, y1, x2, y2, resolution)
+                        seg_xs, seg_ys = segment_line(x1, y1, x2, y2, resolution)
                         prev_pt = None
-                        for i, (sx, sy) in enumerate(segments):
-                            extrusion_per_segment = e_val / len(segments)
-                            scaling_factor = calculate_scaling_factor(current_z, last_bottom_layer, next_top_layer, max_step_size)
-                            # Use wall modulation parameters.
-                            if wall_direction == "x":
-                                sine_input = sx
-                            elif wall_direction == "y":
-                                sine_input = sy
-                            elif wall_direction == "xy":
-                                sine_input = sx + sy
-                            elif wall_direction == "negx":
-                                sine_input = -sx
-                            elif wall_direction == "negy":
-                                sine_input = -sy
-                            elif wall_direction == "negxy":
-                                sine_input = -(sx + sy)
-                            else:
-                                sine_input = sx
+                        # Use wall modulation parameters; they are fixed for the whole bridge.
+                        extrusion_per_segment = e_val / len(seg_xs)
+                        scaling_factor = calculate_scaling_factor(current_z, last_bottom_layer, next_top_layer, max_step_size)
+                        amp_scaled = wall_amplitude * scaling_factor
+                        wave_func = PERIODIC_FUNCTIONS[perimeter_function]
+                        # if we asked for alternation, tack on the per‐loop phase shift (this is always a wall)
+                        add_phase = alternate_loops and current_region in ('internal_wall', 'external_wall')
+                        direction_func = DIRECTION_FUNCTIONS.get(wall_direction, DIRECTION_FUNCTIONS["x"])
+                        for i, (sx, sy) in enumerate(zip(seg_xs, seg_ys)):
                             # compute raw angle
-                            angle = wall_frequency * sine_input
-                            # if we asked for alternation and this is a wall, tack on the per‐loop phase shift
-                            if alternate_loops and current_region in ('internal_wall', 'external_wall'):
+                            angle = wall_frequency * direction_func(sx, sy)
+                            if add_phase:
                                 angle += phase_offset
                             
                             # finally modulate Z
-                            wave_func = PERIODIC_FUNCTIONS[perimeter_function]
-                            z_mod = current_z + wall_amplitude * scaling_factor * wave_func(angle)
+                            z_mod = current_z + amp_scaled * wave_func(angle)
                             if prev_pt is not None:
                                 px, py, pz = prev_pt
                                 dz         = z_mod - pz
@@ -348,16 +501,15 @@ def process_gcode(
                                 # scale your original E
                                 e_adj      = extrusion_per_segment * (seg3d / resolution)
                                 # emit the move at the *previous* point
-                                mod_line = f"G1 X{sx:.3f} Y{sy:.3f} Z{z_mod:.3f} E{e_adj:.5f} ;Bridge\n"
-                            else: mod_line = f"G1 X{sx:.3f} Y{sy:.3f} Z{z_mod:.3f} E{extrusion_per_segment:.5f} ;Bridge no previous point\n"# stash current as "previous" for next iteration
+                                mod_line = bridge_format % (sx, sy, z_mod, e_adj)
+                            else: mod_line = bridge_first_format % (sx, sy, z_mod, extrusion_per_segment)# stash current as "previous" for next iteration
                         
                             prev_pt = (sx, sy, z_mod)
                             
-                            modified_lines.append(mod_line)
+                            yield mod_line
                         # Clear the "new wall" flag and update stored nozzle.
                         in_new_wall_region = False
                         last_nozzle_position = (wall_x, wall_y)
-                        processed_indices.add(line_num)
                         continue
                     else:
                         # If no bridging is needed, clear the flag and update stored nozzle.
@@ -365,111 +517,71 @@ def process_gcode(
                         last_nozzle_position = (wall_x, wall_y)
                 else:
                     # If we cannot parse the coordinates, just pass the line on.
-                    modified_lines.append(line +"; bridge didn't find a match\n")
-                    processed_indices.add(line_num)
+                    yield line +"; bridge didn't find a match\n" if verbose else line
                     continue
 
             # For a standard move with extrusion, process normally.
-            m = re.search(
-                r'X([-+]?[\d]*\.?[\d]+)\s*Y([-+]?[\d]*\.?[\d]+)\s*E([-+]?[\d]*\.?[\d]+)',
-                line
-            )
+            m = _RE_XYE.search(line)
             if not m:
                 # no coords+E → passthrough
-                modified_lines.append(line)
-                processed_indices.add(line_num)
+                yield line
                 continue
             x2, y2, e_total = map(float, m.groups())
 
             # 2) if we have no prior point, emit raw and set nozzle
             if last_nozzle_position is None:
-                modified_lines.append(
-                    line.rstrip() + " ;no prior point, raw emit\n"
+                yield (
+                    line.rstrip() + " ;no prior point, raw emit\n" if verbose else line
                 )
-                processed_indices.add(line_num)
                 last_nozzle_position = (x2, y2)
                 continue
 
-            # 3) segment from true start→end
+            # 3) segment from true start→end; the modulation parameters are fixed for the whole move
             x1, y1 = last_nozzle_position
-            segments = segment_line(x1, y1, x2, y2, resolution)
-            prev_pt = None
-
-            for i, (sx, sy) in enumerate(segments):
-                if i == 0:
-                    # seed prev_pt but don't emit
-                    prev_pt = (sx, sy, current_z)
-                    continue
-
-                # compute per‑segment extrusion and modulation
-                extrusion_per_seg = e_total / (len(segments) - 1)
-                scaling_factor = calculate_scaling_factor(
-                    current_z, last_bottom_layer, next_top_layer, max_step_size
-                )
-                # pick your amp/freq/direction based on region…
-                if current_region == 'infill':
-                    amp, freq, dirn = infill_amplitude, infill_frequency, infill_direction
-                    wave_func = PERIODIC_FUNCTIONS[infill_function]
-                else:
-                    amp, freq, dirn = wall_amplitude, wall_frequency, wall_direction
-                    wave_func = PERIODIC_FUNCTIONS[perimeter_function]
-
-                if dirn == "x":
-                    sine_input = sx
-                elif dirn == "y":
-                    sine_input = sy
-                elif dirn == "xy":
-                    sine_input = sx + sy
-                elif dirn == "negx":
-                    sine_input = -sx
-                elif dirn == "negy":
-                    sine_input = -sy
-                elif dirn == "negxy":
-                    sine_input = -(sx + sy)
-                else:
-                    sine_input = sx
-
-                angle = freq * sine_input
-                # if we asked for alternation and this is a wall, tack on the per‐loop phase shift
-                if alternate_loops and current_region in ('internal_wall', 'external_wall'):
-                    angle += phase_offset
-                
-                # finally modulate Z using the selected wave function
-                z_mod = current_z + amp * scaling_factor * wave_func(angle)
-                dz    = z_mod - prev_pt[2]
-                seg3d = math.hypot(resolution, dz)
-                e_adj = extrusion_per_seg * (seg3d / resolution)
-
-                # 4) emit the slice, annotated so you can verify
-                mod_line = (
-                    f"G1 X{sx:.3f} Y{sy:.3f} Z{z_mod:.3f} "
-                    f"E{e_adj:.5f} "
-                    f";seg {i}/{len(segments)-1} "
-                    f"from ({x1:.3f},{y1:.3f})->({x2:.3f},{y2:.3f})\n"
-                )
-                modified_lines.append(mod_line)
-                prev_pt = (sx, sy, z_mod)
+            scaling_factor = calculate_scaling_factor(
+                current_z, last_bottom_layer, next_top_layer, max_step_size
+            )
+            # pick your amp/freq/direction/wave function based on region…
+            if current_region == 'infill':
+                amp, freq, dirn, func = infill_amplitude, infill_frequency, infill_direction, infill_function
+                phase = 0.0
+            else:
+                amp, freq, dirn, func = wall_amplitude, wall_frequency, wall_direction, perimeter_function
+                # if we asked for alternation, tack on the per‐loop phase shift
+                phase = phase_offset if alternate_loops else 0.0
+
+            # 4) hand the move to modulate_move, here or in a worker process
+            yield (x1, y1, x2, y2, current_z, amp, freq, dirn, func,
+                   phase, scaling_factor, resolution, e_total, verbose)
 
             # 5) done—remember where we ended
-            processed_indices.add(line_num)
             last_nozzle_position = (x2, y2)
             continue
 
         # For non-modulated moves with coordinates, update the stored nozzle position.
-        if line.startswith('G1') and ('X' in line or 'Y' in line):
-            pos_match = re.search(r'X([-+]?[\d]*\.?[\d]+).*?Y([-+]?[\d]*\.?[\d]+)', line)
+        if 'X' in line or 'Y' in line:
+            pos_match = _RE_XY.search(line)
             if pos_match:
                 last_nozzle_position = (float(pos_match.group(1)), float(pos_match.group(2)))
 
-        if line_num not in processed_indices:
-            modified_lines.append(line)
+        yield line
 
-    return modified_lines
 
 
 def save_gcode(output_file, lines):
-    with open(output_file, 'w') as file:
-        file.writelines(lines)
+    # Stream into a temporary file next to the output, then swap it into place
+    output_dir = os.path.dirname(os.path.abspath(output_file))
+    with tempfile.NamedTemporaryFile(mode='w', buffering=IO_BUFFER_SIZE, dir=output_dir, suffix='.tmp', delete=False) as file:
+        try:
+            file.writelines(lines)
+        except BaseException:
+            file.close()
+            os.unlink(file.name)
+            raise
+
+    if os.path.exists(output_file):
+        shutil.copymode(output_file, file.name)
+    os.replace(file.name, output_file)
     logging.info(f"Saved modified G-code to: {output_file}")
 
 
@@ -502,18 +614,44 @@ if __name__ == "__main__":
                         default="sine", help="Periodic function to use for perimeter modulation (default: sine)")
     parser.add_argument("-resolution", type=float, default=DEFAULT_RESOLUTION,
                         help="Resolution of wave segments in mm (default: 0.2)")
+    parser.add_argument("-verbose", action="store_true",
+                        help="Annotate the emitted moves (segment index and source move, bridges) for debugging")
+    parser.add_argument("-jobs", type=int, default=1,
+                        help="Worker processes for modulating extrusion moves (default: 1, 0 = one per CPU)")
 
     args = parser.parse_args()
-
-    modified_lines = process_gcode(
-        args.input_file,
-        args.wall_amplitude, args.wall_frequency, args.wall_direction,
-        args.infill_amplitude, args.infill_frequency, args.infill_direction,
-        args.include_infill, args.include_perimeters, args.include_external_perimeters,
-        args.max_step_size, alternate_loops=args.alternate_loops,
-        infill_function=args.infill_function,
-        perimeter_function=args.perimeter_function,
-        resolution=args.resolution
+    if args.jobs < 0:
+        parser.error("argument -jobs: must be 0 or a positive number")
+
+    # Configured here rather than at import so that worker processes do not reopen the log
+    logging.basicConfig(
+        level=logging.DEBUG,
+        format="%(asctime)s - %(levelname)s - %(message)s",
+        handlers=[
+            logging.FileHandler("gcode_debug.log"),
+            logging.StreamHandler(sys.stdout)
+        ]
     )
 
-    save_gcode(args.input_file, modified_lines)
\ No newline at end of file
+    workers = args.jobs or os.cpu_count() or 1
+    # A single worker runs in-process rather than in a one-process pool
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    try:
+        modified_lines = process_gcode(
+            args.input_file,
+            args.wall_amplitude, args.wall_frequency, args.wall_direction,
+            args.infill_amplitude, args.infill_frequency, args.infill_direction,
+            args.include_infill, args.include_perimeters, args.include_external_perimeters,
+            args.max_step_size, alternate_loops=args.alternate_loops,
+            infill_function=args.infill_function,
+            perimeter_function=args.perimeter_function,
+            resolution=args.resolution,
+            verbose=args.verbose,
+            executor=executor,
+            workers=workers
+        )
+
+        save_gcode(args.input_file, modified_lines)
+    finally:
+        if executor is not None:
+            executor.shutdown()
\ No newline at end of file
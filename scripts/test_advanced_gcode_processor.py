@@ -3,6 +3,7 @@
 Test script for the advanced G-code processor that combines wall shifting and non-planar infill.
 """
 import os
+import re
 import sys
 import tempfile
 import subprocess
@@ -145,6 +146,30 @@ def test_script_basic_functionality():
                 print(f"  ✗ Test case {i+1} failed with exception: {e}")
                 return False
         
+        # Worker processes must not change the output
+        print("  Testing -jobs 2 against -jobs 1")
+        outputs = []
+        for jobs in ('1', '2'):
+            test_file = f"{temp_file}_jobs{jobs}"
+            shutil.copy2(temp_file, test_file)
+            try:
+                result = subprocess.run(
+                    ['python3', script_path, test_file, '-nonPlanar', '1', '-jobs', jobs],
+                    capture_output=True, text=True, cwd=script_dir
+                )
+                if result.returncode != 0:
+                    print(f"  ✗ -jobs {jobs} failed:")
+                    print(f"    stderr: {result.stderr}")
+                    return False
+                with open(test_file, 'r') as f:
+                    outputs.append(f.read())
+            finally:
+                os.unlink(test_file)
+        if outputs[0] != outputs[1]:
+            print("  ✗ -jobs 2 output differs from -jobs 1")
+            return False
+        print("  ✓ -jobs 2 output matches -jobs 1")
+        
         print("  ✓ All basic functionality tests passed")
         return True
         
@@ -172,7 +197,7 @@ G1 X10 Y10 E0.1 F1800
     
     try:
         result = subprocess.run(
-            ['python3', script_path, temp_file, '-extrusionMultiplier', '1.0'],
+            ['python3', script_path, temp_file, '-extrusionMultiplier', '1.0', '-debug'],
             capture_output=True, text=True, cwd=script_dir
         )
         
@@ -189,13 +214,36 @@ G1 X10 Y10 E0.1 F1800
                 log_content = f.read()
             if "Detected layer height from G-code: 0.15mm" in log_content:
                 print("  ✓ Layer height detection test passed")
-                return True
             else:
                 print("  ✗ Layer height not detected correctly in log")
                 return False
         else:
             print("  ✗ Log file not created")
             return False
+        
+        # Worker processes must not repeat the header records. Enough infill moves
+        # are logged for each worker's log buffer to fill and be written out.
+        with open(temp_file, 'w') as f:
+            f.write(test_gcode_with_layer_height)
+            f.write(";TYPE:Internal infill\n")
+            f.write("G1 X10 Y15 E0.1 F1800\nG1 X12 Y15 E0.1 F1800\n" * 15000)
+        result = subprocess.run(
+            ['python3', script_path, temp_file, '-nonPlanar', '1', '-verbose', '-jobs', '2'],
+            capture_output=True, text=True, cwd=script_dir
+        )
+        if result.returncode != 0:
+            print(f"  ✗ -verbose -jobs 2 run failed:")
+            print(f"    stderr: {result.stderr}")
+            return False
+        with open(log_file, 'r') as f:
+            log_content = f.read()
+        for record in ("Starting G-code processing", "Detected layer height from G-code: 0.15mm"):
+            count = log_content.count(record)
+            if count != 1:
+                print(f"  ✗ '{record}' logged {count} times with -jobs 2")
+                return False
+        print("  ✓ Header records logged once with -verbose -jobs 2")
+        return True
             
     finally:
         if os.path.exists(temp_file):
@@ -224,9 +272,78 @@ def test_argument_parsing():
         print(f"  ✗ Argument parsing test failed: {e}")
         return False
     
+    # Negative worker counts are rejected
+    result = subprocess.run(
+        ['python3', script_path, 'unused.gcode', '-jobs', '-1'],
+        capture_output=True, text=True, cwd=script_dir
+    )
+    if result.returncode != 2 or '-jobs' not in result.stderr:
+        print("  ✗ -jobs -1 was not rejected")
+        return False
+    print("  ✓ Negative -jobs rejected")
+    
     print("  ✓ Argument parsing test passed")
     return True
 
+def test_replace_e():
+    """Test that replace_e rewrites the E word exactly like the regex substitution."""
+    print("Testing replace_e...")
+
+    from advanced_gcode_processor import replace_e, _E_SUB_RE
+
+    new_e = 1.23456789
+    cases = [
+        "G1 X1 Y2 E0.5\n",
+        "G1 X1 Y2E0.5\n",
+        "G1 X1 Y2 E-0.5 F300\n",
+        # Regular layers append a comment after the newline before rewriting E
+        "G1 X1 Y2 E0.5\n ; current layer: 2 total layers: 5 \n",
+    ]
+    for line in cases:
+        expected = _E_SUB_RE.sub(f'E{new_e:.5f}', line)
+        actual = replace_e(line, new_e)
+        if actual != expected:
+            print(f"  ✗ replace_e({line!r}) returned {actual!r}, expected {expected!r}")
+            return False
+
+    print("  ✓ replace_e test passed")
+    return True
+
+def test_wall_reorder_order():
+    """Test that each shifted/non-shifted wall pair is emitted non-shifted wall first."""
+    print("Testing wall reorder order...")
+
+    from advanced_gcode_processor import process_wall_shifting
+
+    wall_gcode = """;TYPE:Perimeter
+G1 X10 Y10 F7200
+G1 X20 Y10 E0.1
+G1 X20 Y20 E0.2
+G1 X11 Y11 F7200
+G1 X19 Y11 E0.1
+G1 X19 Y19 E0.2
+G1 X12 Y12 F7200
+G1 X18 Y12 E0.1
+G1 X18 Y18 E0.2
+G1 X13 Y13 F7200
+G1 X17 Y13 E0.1
+G1 X17 Y17 E0.2
+G1 X14 Y14 F7200
+;TYPE:External perimeter
+G1 X9 Y9 E0.3
+"""
+    lines = ["G1 Z0.4 F3000\n"] + wall_gcode.splitlines(keepends=True)
+    output = list(process_wall_shifting(lines, 0.2, 1.1, 5))
+
+    # Block #1 and #3 are shifted (S1, S3), #2 and #4 are not (N2, N4)
+    block_order = [int(m.group(1)) for line in output
+                   for m in [re.search(r"(?:Shifted|Reset) Z for block #(\d+)", line)] if m]
+    if block_order == [2, 1, 4, 3]:
+        print("  ✓ Walls S1,N2,S3,N4 emitted as N2,S1,N4,S3")
+        return True
+    print(f"  ✗ Unexpected wall order: {block_order}")
+    return False
+
 def main():
     """Run all tests."""
     print("Running Advanced G-code Processor Tests")
@@ -250,6 +367,18 @@ def main():
     if not test_script_basic_functionality():
         all_passed = False
     
+    print()
+    
+    # Test extrusion rewriting
+    if not test_replace_e():
+        all_passed = False
+    
+    print()
+    
+    # Test wall reordering
+    if not test_wall_reorder_order():
+        all_passed = False
+    
     print()
     print("=" * 50)
     if all_passed:
@@ -12,7 +12,7 @@ script_dir = os.path.dirname(os.path.abspath(__file__))
 sys.path.insert(0, script_dir)
 
 # Import the modulation script
-from gcode_nonplanar_modulation import PERIODIC_FUNCTIONS
+from gcode_nonplanar_modulation import PERIODIC_FUNCTIONS, PERIODIC_BATCH_FUNCTIONS, segment_line, detect_header
 import math
 
 def test_wave_functions():
@@ -34,6 +34,63 @@ def test_wave_functions():
     
     return True
 
+def test_batch_wave_functions():
+    """Test that the batch wave functions match their scalar counterparts."""
+    print("Testing batch wave functions...")
+    
+    angles = [i * math.pi / 7 for i in range(-30, 31)] + [-1e-9, 1e-9, -2*math.pi, 2*math.pi]
+    
+    for func_name, func in PERIODIC_FUNCTIONS.items():
+        expected = [func(a) for a in angles]
+        if PERIODIC_BATCH_FUNCTIONS[func_name](angles) != expected:
+            print(f"  ✗ {func_name} batch wave differs from the scalar wave")
+            return False
+        print(f"  ✓ {func_name} batch wave matches the scalar wave")
+    
+    return True
+
+def test_segment_line():
+    """Test that segment counts are floored, as in the original implementation."""
+    print("Testing segment_line...")
+    
+    # 0.2 is slightly above 1/5 in binary, so 10 // 0.2 == 49 (while 10 / 0.2 rounds to 50.0)
+    xs, ys = segment_line(0, 0, 10, 0, 0.2)
+    if len(xs) != 50 or len(ys) != 50:
+        print(f"  ✗ Expected 49 segments (50 points), got {len(xs) - 1}")
+        return False
+    xs, ys = segment_line(0, 0, 10, 0, 0.2, include_start=False)
+    if len(xs) != 49 or xs[-1] != 10:
+        print(f"  ✗ Expected 49 points ending at X10 without the start point, got {len(xs)}")
+        return False
+    
+    print("  ✓ segment_line test passed")
+    return True
+
+def test_detect_header():
+    """Test slicer and G-code flavor detection from the header and footer comment blocks."""
+    print("Testing header detection...")
+    
+    moves = ["G1 Z0.2 F3000\n", "G1 X10 Y10 E0.1 F1800\n"]
+    cases = [
+        # flavor at the top
+        (["; Generated by OrcaSlicer\n", "; gcode_flavor = marlin\n"] + moves, ('orcaslicer', 'marlin')),
+        # flavor at the bottom, after blank lines
+        (["; generated by PrusaSlicer\n"] + moves + ["\n", "; prusaslicer_config = begin\n",
+                                                    "; gcode_flavor = marlin\n", "\n", "\n"], ('prusaslicer', 'marlin')),
+        (["; Generated by OrcaSlicer\n"] + moves + ["\n", "; gcode_flavor = marlin\n", "\n"], ('orcaslicer', 'marlin')),
+        # no flavor anywhere, and a flavor-like line between moves is not a header
+        (["; Generated by OrcaSlicer\n"] + moves + ["; gcode_flavor = marlin\n"] + moves, ('orcaslicer', None)),
+        (["G28\n"] + moves, (None, None)),
+    ]
+    for lines, expected in cases:
+        result = detect_header(lines)
+        if result != expected:
+            print(f"  ✗ detect_header returned {result}, expected {expected}")
+            return False
+    
+    print("  ✓ Header detection test passed")
+    return True
+
 def test_script_execution():
     """Test that the script executes without errors."""
     print("Testing script execution...")
@@ -83,6 +140,41 @@ G1 X20 Y15 E0.4 F1800
                 print(f"  ✗ Test case {i+1} failed with exception: {e}")
                 return False
         
+        # Worker processes must not change the output
+        print("  Testing -jobs 2 against -jobs 1")
+        outputs = []
+        for jobs in ('1', '2'):
+            test_file = f"{temp_file}_jobs{jobs}"
+            with open(test_file, 'w') as f:
+                f.write(test_gcode)
+            try:
+                result = subprocess.run(
+                    ['python3', script_path, test_file, '-include-infill', '-include-external-perimeters', '-jobs', jobs],
+                    capture_output=True, text=True, cwd=script_dir
+                )
+                if result.returncode != 0:
+                    print(f"  ✗ -jobs {jobs} failed:")
+                    print(f"    stderr: {result.stderr}")
+                    return False
+                with open(test_file, 'r') as f:
+                    outputs.append(f.read())
+            finally:
+                os.unlink(test_file)
+        if outputs[0] != outputs[1]:
+            print("  ✗ -jobs 2 output differs from -jobs 1")
+            return False
+        print("  ✓ -jobs 2 output matches -jobs 1")
+        
+        # Negative worker counts are rejected
+        result = subprocess.run(
+            ['python3', script_path, temp_file, '-jobs', '-1'],
+            capture_output=True, text=True, cwd=script_dir
+        )
+        if result.returncode != 2 or '-jobs' not in result.stderr:
+            print("  ✗ -jobs -1 was not rejected")
+            return False
+        print("  ✓ Negative -jobs rejected")
+        
         print("  ✓ All script execution tests passed")
         return True
         
@@ -91,6 +183,49 @@ G1 X20 Y15 E0.4 F1800
         if os.path.exists(temp_file):
             os.unlink(temp_file)
 
+def test_verbose_annotations():
+    """Test that debug annotations are only written with -verbose."""
+    print("Testing -verbose annotations...")
+    
+    # The travel to X0 Y0 makes the first wall move a bridge, the second a segmented move
+    test_gcode = """; Generated by OrcaSlicer
+G1 Z0.2 F3000
+;TYPE:Outer wall
+G1 X0 Y0 F7200
+G1 X10 Y10 E0.5 F1800
+G1 X20 Y10 E0.5 F1800
+"""
+    script_path = os.path.join(script_dir, 'gcode_nonplanar_modulation.py')
+    outputs = {}
+    for extra in ([], ['-verbose']):
+        with tempfile.NamedTemporaryFile(mode='w', suffix='.gcode', delete=False) as f:
+            f.write(test_gcode)
+            temp_file = f.name
+        try:
+            result = subprocess.run(
+                ['python3', script_path, temp_file, '-include-external-perimeters'] + extra,
+                capture_output=True, text=True, cwd=script_dir
+            )
+            if result.returncode != 0:
+                print(f"  ✗ Run with {extra} failed:")
+                print(f"    stderr: {result.stderr}")
+                return False
+            with open(temp_file, 'r') as f:
+                outputs[bool(extra)] = f.read()
+        finally:
+            os.unlink(temp_file)
+    
+    for marker in (';seg', ';Bridge'):
+        if marker in outputs[False]:
+            print(f"  ✗ Default output contains {marker}")
+            return False
+        if marker not in outputs[True]:
+            print(f"  ✗ -verbose output is missing {marker}")
+            return False
+    
+    print("  ✓ Annotations only written with -verbose")
+    return True
+
 def main():
     """Run all tests."""
     print("Running G-code Non-Planar Modulation Script Tests")
@@ -104,10 +239,34 @@ def main():
     
     print()
     
+    # Test batch wave functions
+    if not test_batch_wave_functions():
+        all_passed = False
+    
+    print()
+    
+    # Test line segmentation
+    if not test_segment_line():
+        all_passed = False
+    
+    print()
+    
+    # Test header detection
+    if not test_detect_header():
+        all_passed = False
+    
+    print()
+    
     # Test script execution
     if not test_script_execution():
         all_passed = False
     
+    print()
+    
+    # Test -verbose annotations
+    if not test_verbose_annotations():
+        all_passed = False
+    
     print()
     print("=" * 50)
     if all_passed: